@@ -7,8 +7,12 @@ import logging
 import openpyxl
 import tempfile
 import contextlib
+import textwrap
 import os
+import atexit
+import traceback
 import pandas as pd
+import orjson
 from modules.excel_parser.parser_v3 import ExcelFormulaParser, ParserConfig, FormulaCell
 from modules.budget_mapper import BudgetMapper
 from modules.pdf_to_word_converter import PDFToWordConverter
@@ -47,11 +51,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Injection des styles CSS et JavaScript
-st.markdown(get_main_styles(), unsafe_allow_html=True)
-st.markdown(get_javascript(), unsafe_allow_html=True)
 # CSS additionnel pour forcer la suppression des marges Streamlit
-st.markdown("""
+_SPACING_FIXES_CSS = """
 <style>
     /* Force removal of Streamlit default spacing */
     .main > div {
@@ -99,7 +100,15 @@ st.markdown("""
         overflow-y: auto !important;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Injection des styles CSS et JavaScript en un seul élément
+# Un seul appel, mais chaque bloc dédenté séparément : markdown dédente le texte joint une seule fois
+# (indentation minimale commune), et un <script> resté indenté de 4+ espaces deviendrait un bloc de code
+st.markdown(
+    "\n".join(textwrap.dedent(block).strip() for block in (get_main_styles(), get_javascript(), _SPACING_FIXES_CSS)),
+    unsafe_allow_html=True
+)
 
 # Context manager pour fichiers temporaires
 @contextlib.contextmanager
@@ -138,11 +147,18 @@ def init_services():
     st.session_state['excel_handler'] = services['excel_handler'] #Stocker excel_handler pour y accéder depuis json_helper
 
     # Nettoyage automatique des fichiers temporaires
-    import atexit
     atexit.register(lambda: services['excel_handler'].cleanup_temp_files())
     
     return services
 
+@st.cache_resource
+def init_layout():
+    """
+    Construit le layout une seule fois par processus
+    MainLayout ne garde aucun état de session : tout passe par st.session_state
+    """
+    return MainLayout(init_services())
+
 # Message de bienvenue
 WELCOME_MESSAGE = """Bonjour, 
 je peux vous aider à :
@@ -174,6 +190,7 @@ def init_session_state():
         'is_pdf_loaded': False,
         'converted_docx': None,
         'pdf_convert_preserve_layout': True,
+        'chat_revision': 0,            # Incrémenté quand l'historique est modifié autrement que par ajout
     }
     
     # Initialiser les valeurs par défaut
@@ -252,8 +269,8 @@ async def handle_file_upload(uploaded_file):
     # Réinitialiser les états PDF si on charge un nouveau fichier
     st.session_state.is_pdf_loaded = False
     st.session_state.converted_docx = None
-    # Éviter les doublons
-    file_key = f"{uploaded_file.name}_{uploaded_file.size}"
+    # Éviter les doublons : file_id change à chaque upload, même fichier modifié de même nom/taille
+    file_key = uploaded_file.file_id
     if file_key in st.session_state.processed_files:
         return
     
@@ -275,7 +292,8 @@ async def handle_file_upload(uploaded_file):
 async def process_file(uploaded_file):
     """Traite le fichier uploadé"""
     try:
-        file_content = uploaded_file.getbuffer()
+        # Une seule copie en bytes : un memoryview de getbuffer() garderait le tampon de l'upload en vie
+        file_content = uploaded_file.getvalue()
         suffix = Path(uploaded_file.name).suffix
         
         with temporary_file(file_content, suffix=suffix) as temp_path:
@@ -310,8 +328,7 @@ async def process_file(uploaded_file):
                 response = f"✅ J'ai chargé votre fichier Excel '{uploaded_file.name}'. Il contient {len(st.session_state.excel_workbook.sheetnames)} feuilles. Vous pouvez maintenant :\n\n• Visualiser et éditer les données dans l'onglet Excel\n• Extraire les données budgétaires\n• Utiliser l'outil BPSS pour les mesures catégorielles"
                 
             elif uploaded_file.name.endswith('.json'):
-                import json
-                st.session_state.json_data = json.loads(content)
+                st.session_state.json_data = orjson.loads(file_content)
                 response = f"✅ Fichier JSON de configuration chargé. Il contient {len(st.session_state.json_data.get('tags', []))} tags pour le mapping automatique."
 
             elif uploaded_file.name.endswith('.pdf'):
@@ -422,6 +439,7 @@ def handle_tool_action(action: dict):
             'timestamp': datetime.now().strftime("%H:%M"),
             'type': 'welcome'
         }]
+        st.session_state.chat_revision = st.session_state.get('chat_revision', 0) + 1
         st.session_state.processed_files = set()
         st.session_state.current_file = None
         st.session_state.excel_workbook = None
@@ -458,9 +476,14 @@ async def extract_budget_data():
     
     with st.spinner("Extraction en cours..."):
         try:
-            content = st.session_state.current_file['content']
+            content = st.session_state.current_file.get('content')
             file_name = st.session_state.current_file['name']
             
+            # Les classeurs chargés depuis l'espace Excel n'ont pas de contenu texte
+            if not content:
+                st.error("❌ Aucun contenu texte à extraire pour ce fichier")
+                return
+            
             # Limiter la taille
             if len(content) > 10000:
                 content = content[:10000] + "\n\n[... contenu tronqué ...]"
@@ -495,9 +518,6 @@ async def process_bpss(data: dict):
         progress = st.progress(0, text="Traitement BPSS...")
         
         # Créer des fichiers temporaires SANS les supprimer automatiquement
-        import tempfile
-        import os
-        
         temp_files = []
         temp_paths = {}
         
@@ -678,7 +698,6 @@ def apply_excel_formulas():
             st.session_state.excel_workbook = updated_wb
             
             # Sauvegarder temporairement pour l'affichage des valeurs
-            import tempfile
             with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
                 updated_wb.save(tmp.name)
                 services['excel_handler'].current_path = tmp.name
@@ -768,7 +787,6 @@ def apply_excel_formulas():
             
             # En mode debug, afficher la trace complète
             if st.session_state.get('debug_mode'):
-                import traceback
                 st.code(traceback.format_exc(), language="python")
 
 async def map_budget_to_cells():
@@ -906,7 +924,6 @@ async def apply_validated_mapping():
             if success_count > 0:
                 # IMPORTANT : Sauvegarder le workbook modifié dans un fichier temporaire
                 # pour pouvoir afficher les valeurs mises à jour
-                import tempfile
                 with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
                     workbook.save(tmp.name)
                     services['excel_handler'].current_path = tmp.name
@@ -989,7 +1006,6 @@ async def apply_validated_mapping():
             
             # En mode debug, afficher plus de détails
             if st.session_state.get('debug_mode'):
-                import traceback
                 st.code(traceback.format_exc(), language="python")
 
 # Initialisation des services
@@ -1018,7 +1034,7 @@ def main():
                     for widget_key in st.session_state:
                         if widget_key.startswith('file_upload_'):
                             file = st.session_state.get(widget_key)
-                            if file and f"{file.name}_{file.size}" == file_key:
+                            if file and getattr(file, 'file_id', None) == file_key:
                                 asyncio.run(process_file(file))
                                 break
             else:
@@ -1036,8 +1052,8 @@ def main():
         elif action['type'] == 'convert_pdf':  
             asyncio.run(convert_pdf_to_word())
     
-    # Créer et rendre l'interface
-    layout = MainLayout(services)
+    # Rendre l'interface (layout partagé par tous les reruns)
+    layout = init_layout()
     layout.render(
         on_message_send=lambda msg: asyncio.run(handle_message_send(msg)),
         on_file_upload=lambda file: asyncio.run(handle_file_upload(file)),
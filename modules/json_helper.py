@@ -1,5 +1,5 @@
 # modules/json_helper.py
-import json
+import orjson
 import pandas as pd
 from typing import List, Dict, Any, Optional, Tuple
 import logging
@@ -8,6 +8,9 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Sortie indentée comme json.dumps(indent=2, ensure_ascii=False), clés non-str converties
+_DUMP_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
 class JSONHelper:
     """Helper pour traiter les fichiers JSON de configuration"""
     
@@ -17,8 +20,8 @@ class JSONHelper:
     def load_json(self, file_path: str) -> Dict[str, Any]:
         """Charge un fichier JSON"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.current_json = json.load(f)
+            with open(file_path, 'rb') as f:
+                self.current_json = orjson.loads(f.read())
             logger.info(f"JSON chargé: {file_path}")
             return self.current_json
         except Exception as e:
@@ -28,7 +31,7 @@ class JSONHelper:
     def load_json_from_content(self, content: str) -> Dict[str, Any]:
         """Charge un JSON depuis du contenu texte"""
         try:
-            self.current_json = json.loads(content)
+            self.current_json = orjson.loads(content)
             logger.info("JSON chargé depuis contenu")
             return self.current_json
         except Exception as e:
@@ -220,13 +223,13 @@ class JSONHelper:
     
     def export_json(self, json_data: Dict[str, Any]) -> str:
         """Exporte le JSON en string formaté"""
-        return json.dumps(json_data, indent=2, ensure_ascii=False)
+        return orjson.dumps(json_data, option=_DUMP_OPTIONS).decode('utf-8')
     
     def save_json(self, json_data: Dict[str, Any], file_path: str):
         """Sauvegarde le JSON dans un fichier"""
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, indent=2, ensure_ascii=False)
+            with open(file_path, 'wb') as f:
+                f.write(orjson.dumps(json_data, option=_DUMP_OPTIONS))
             logger.info(f"JSON sauvegardé: {file_path}")
         except Exception as e:
             logger.error(f"Erreur sauvegarde JSON: {str(e)}")
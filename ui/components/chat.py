@@ -1,9 +1,31 @@
 # ui/components/chat.py - Simplified chat components
 import streamlit as st
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
+from string import Template
+import html
 import re
 
+FILE_MESSAGE_PREFIX = "📎 Fichier envoyé :"
+
+# Patterns compilés une fois pour tout l'historique
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_LIST_MARKER_RE = re.compile(r'^[\s\-•]+')
+
+_MESSAGE_TEMPLATE = Template("""
+        <div class="message-wrapper $role_class">
+            <div class="message-avatar $role_class">
+                <span>$avatar</span>
+            </div>
+            <div class="message-content">
+                <div class="message-bubble $role_class">
+                    <div class="message-text">$content</div>
+                </div>
+                <span class="message-time">$timestamp</span>
+            </div>
+        </div>
+        """)
+
 class ChatComponents:
     """Simplified chat components focused on functionality"""
     
@@ -23,55 +45,53 @@ class ChatComponents:
     @staticmethod
     def render_message(message: Dict, index: int = 0):
         """Renders a message with clean styling"""
-        timestamp = message.get('timestamp', datetime.now().strftime("%H:%M"))
-        role_class = 'user' if message['role'] == 'user' else 'bot'
-        
-        # Format message content
-        content = message['content']
+        return ChatComponents.render_message_batch([message]), False
+    
+    @staticmethod
+    def render_message_batch(messages: Iterable[Dict]) -> str:
+        """Renders a run of messages as a single HTML string"""
+        return "".join(ChatComponents.render_message_fragments(messages))
+    
+    @staticmethod
+    def render_message_fragments(messages: Iterable[Dict]) -> List[str]:
+        """Renders messages to one HTML fragment each (empty for hidden messages)"""
+        messages = list(messages)
+        visible = [msg for msg in messages if msg.get('meta') != 'file_content']
+        if not visible:
+            return [""] * len(messages)
         
         # Escape HTML
-        content = ChatComponents._escape_html(content)
+        contents = [ChatComponents._escape_html(msg['content']) for msg in visible]
         
-        # Handle file messages
-        if content.startswith("📎 Fichier envoyé :"):
-            file_name = content.replace("📎 Fichier envoyé :", "").strip()
-            file_size = message.get('file_size')
-            content = ChatComponents._format_file_message(file_name, file_size)
-        else:
-            # Basic formatting
-            content = content.replace('\n', '<br>')
-            # Bold text
-            content = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', content)
-            # Lists
-            content = ChatComponents._format_simple_lists(content)
+        # Basic formatting with the shared precompiled pattern
+        for k, content in enumerate(contents):
+            if not content.startswith(FILE_MESSAGE_PREFIX):
+                content = _BOLD_RE.sub(r'<strong>\1</strong>', content.replace('\n', '<br>'))
+                contents[k] = ChatComponents._format_simple_lists(content)
         
-        # Regular message
-        avatar = "👤" if role_class == 'user' else "🤖"
-        return f"""
-        <div class="message-wrapper {role_class}">
-            <div class="message-avatar {role_class}">
-                <span>{avatar}</span>
-            </div>
-            <div class="message-content">
-                <div class="message-bubble {role_class}">
-                    <div class="message-text">{content}</div>
-                </div>
-                <span class="message-time">{timestamp}</span>
-            </div>
-        </div>
-        """, False
+        parts = []
+        for msg, content in zip(visible, contents):
+            # Handle file messages
+            if content.startswith(FILE_MESSAGE_PREFIX):
+                file_name = content.replace(FILE_MESSAGE_PREFIX, "").strip()
+                content = ChatComponents._format_file_message(file_name, msg.get('file_size'))
+            
+            role_class = 'user' if msg['role'] == 'user' else 'bot'
+            parts.append(_MESSAGE_TEMPLATE.substitute(
+                role_class=role_class,
+                avatar="👤" if role_class == 'user' else "🤖",
+                content=content,
+                timestamp=msg.get('timestamp', datetime.now().strftime("%H:%M"))
+            ))
+        
+        # Realign on the input, hidden messages render as empty fragments
+        rendered = iter(parts)
+        return ["" if msg.get('meta') == 'file_content' else next(rendered) for msg in messages]
     
     @staticmethod
     def _escape_html(text: str) -> str:
         """Escape HTML characters"""
-        html_escape = {
-            "&": "&amp;",
-            '"': "&quot;",
-            "'": "&apos;",
-            ">": "&gt;",
-            "<": "&lt;",
-        }
-        return "".join(html_escape.get(c, c) for c in text)
+        return html.escape(text, quote=True)
     
     @staticmethod
     def _format_file_message(file_name: str, file_size: Optional[int] = None) -> str:
@@ -107,7 +127,7 @@ class ChatComponents:
                 if not in_list:
                     formatted.append('<ul style="margin: 0.5rem 0; padding-left: 1.5rem;">')
                     in_list = True
-                item = re.sub(r'^[\s\-•]+', '', line)
+                item = _LIST_MARKER_RE.sub('', line)
                 formatted.append(f'<li>{item}</li>')
             else:
                 if in_list and line.strip():
@@ -1,36 +1,299 @@
 # ui/layouts.py - Version complètement corrigée
 import streamlit as st
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
 from datetime import datetime
 from .components.chat import ChatComponents
 from .components.inputs import InputComponents
-import base64
 import time
-from pathlib import Path
 import pandas as pd
+import numpy as np
 import logging
-import os
+import hashlib
+import string
+import textwrap
+import orjson
+from itertools import islice
+from contextlib import nullcontext
 
 logger = logging.getLogger(__name__)
 
+# Number of chat messages rendered at first, then per "load older" click
+_CHAT_WINDOW = 50
+
+# Stateless components shared by every rerun and session
+_CHAT_COMPONENTS = ChatComponents()
+_INPUT_COMPONENTS = InputComponents()
+
+# Static chat fragments, built once at import
+_TYPING_HTML = _CHAT_COMPONENTS.render_typing_indicator()
+_CHAT_PANEL_HTML = {
+    full_width: f"""
+        <div class="chat-panel{'_full' if full_width else ''}">
+            {_CHAT_COMPONENTS.render_header()}
+        </div>
+        """
+    for full_width in (False, True)
+}
+
+# Header de l'interface de vérification (précédé du séparateur de l'espace Excel)
+# Constantes dédentées une à une : header et statut sont joints dans un même markdown
+_VERIFICATION_HEADER_HTML = textwrap.dedent("""
+        <hr>
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                    padding: 2rem; border-radius: 10px; margin-bottom: 2rem;">
+            <h2 style="color: white; margin: 0;">🔍 Vérification et Validation du Mapping</h2>
+            <p style="color: rgba(255,255,255,0.9); margin: 0.5rem 0 0 0;">
+                Vérifiez que les données budgétaires sont correctement associées aux cellules Excel
+            </p>
+        </div>
+        """).strip()
+# Cartes de statut du mapping
+_APPLIED_STATUS_HTML = textwrap.dedent("""
+            <div style="background: #d4edda; border: 1px solid #c3e6cb; 
+                        border-radius: 8px; padding: 1.5rem; margin-bottom: 1rem;">
+                <h3 style="color: #155724; margin: 0;">✅ Mapping Appliqué avec Succès!</h3>
+                <p style="color: #155724; margin: 0.5rem 0 0 0;">
+                    Les données ont été écrites dans votre fichier Excel.
+                </p>
+            </div>
+            """).strip()
+_PENDING_STATUS_HTML = textwrap.dedent("""
+            <div style="background: #fff3cd; border: 1px solid #ffeaa7; 
+                        border-radius: 8px; padding: 1.5rem; margin-bottom: 1rem;">
+                <h3 style="color: #856404; margin: 0;">⏳ Validation Requise</h3>
+                <p style="color: #856404; margin: 0.5rem 0 0 0;">
+                    Vérifiez les associations proposées avant d'appliquer le mapping.
+                </p>
+            </div>
+            """).strip()
+
+# Gauge et barres de confiance de l'interface de vérification
+_CONFIDENCE_GAUGE_TEMPLATE = string.Template("""
+            <div style="text-align: center; padding: 1rem;">
+                <div style="position: relative; width: 150px; height: 150px; margin: 0 auto;">
+                    <svg viewBox="0 0 36 36" style="width: 100%; height: 100%;">
+                        <path d="M18 2.0845 a 15.9155 15.9155 0 0 1 0 31.831 a 15.9155 15.9155 0 0 1 0 -31.831"
+                            fill="none" stroke="#eee" stroke-width="3"/>
+                        <path d="M18 2.0845 a 15.9155 15.9155 0 0 1 0 31.831 a 15.9155 15.9155 0 0 1 0 -31.831"
+                            fill="none" stroke="$color" stroke-width="3"
+                            stroke-dasharray="$dash, 100"/>
+                        <text x="18" y="20.35" style="font-size: 10px; text-anchor: middle; fill: #333;">
+                            $label
+                        </text>
+                    </svg>
+                </div>
+                <h4 style="margin-top: 1rem;">Confiance Moyenne</h4>
+            </div>
+            """)
+# Dédenté : les barres suivent un titre markdown dans le même bloc (sinon rendues comme du code)
+_CONFIDENCE_BAR_TEMPLATE = string.Template(textwrap.dedent("""
+                    <div style="margin-bottom: 1rem;">
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 0.25rem;">
+                            <span>$level</span>
+                            <span style="font-weight: bold;">$count ($label)</span>
+                        </div>
+                        <div style="background: #e0e0e0; height: 25px; border-radius: 5px; overflow: hidden;">
+                            <div style="width: $percentage%; height: 100%; background: $color; 
+                                        transition: width 0.5s ease;"></div>
+                        </div>
+                    </div>
+                    """))
+
+# État remis à zéro par "Nouveau mapping" / "Refaire l'analyse"
+_MAPPING_RESET = {'pending_mapping': None, 'mapping_report': None, 'mapping_validated': False}
+
+# Static navbar, Excel header and drop overlay markup
+_NAVBAR_TITLE_HTML = """
+            <div style="display: flex; align-items: center; gap: 0.75rem; padding: 0.5rem 0;">
+                <span style="font-size: 1.25rem; font-weight: 600; color: #1e293b;">BudgiBot</span>
+                <span style="font-size: 0.875rem; color: #64748b;">Compléteur d'excel automatique</span>
+            </div>
+            """
+_NAVBAR_SEPARATOR_HTML = "<hr style='margin: 0.5rem 0 1rem 0; border: none; border-bottom: 1px solid #e2e8f0;'>"
+_EXCEL_PANEL_HTML = {
+    full_width: f"""
+        <div class="excel-panel{'_full' if full_width else ''}">
+            <div class="excel-header">
+                <h3>Espace Excel</h3>
+                <p>
+                    Ajouter un classeur, extraire des données de messages, utiliser l'outil BPSS
+                </p>
+            </div>
+        </div>
+        """
+    for full_width in (False, True)
+}
+_DROP_OVERLAY_HTML = """
+        <div id="drop-overlay" class="drop-overlay">
+            <div class="drop-content">
+                <div class="drop-icon">
+                    <span style="font-size: 100px;">📥</span>
+                </div>
+                <h2>Déposez votre fichier ici</h2>
+                <p>PDF, DOCX, XLSX, JSON, TXT, MSG</p>
+            </div>
+        </div>
+        """
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_json_config(digest: bytes, _raw: bytes) -> Dict[str, Any]:
+    """Parse une configuration JSON uploadée, une fois par contenu (clé : digest)"""
+    return orjson.loads(_raw)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _confidence_distribution_markdown(by_confidence: Tuple[Tuple[str, int], ...],
+                                      total_entries: int) -> str:
+    """Titre + barres de distribution de la confiance, construits une fois par distribution"""
+    colors = ['#28a745', '#90EE90', '#ffc107', '#dc3545']
+    parts = ["### 📊 Distribution de la Confiance\n\n"]
+    for i, (level, count) in enumerate(by_confidence):
+        if count > 0:
+            percentage = (count / total_entries) * 100
+            parts.append(_CONFIDENCE_BAR_TEMPLATE.substitute(
+                level=level, count=count, label=f"{percentage:.1f}%",
+                percentage=percentage, color=colors[i % len(colors)]
+            ))
+    return "".join(parts)
+
+
+def _extracted_dataframe() -> pd.DataFrame:
+    """
+    DataFrame des données extraites, partagé par l'éditeur et la vue d'ensemble
+    Construit une fois par liste extraite (remplacée à chaque extraction/sauvegarde)
+    """
+    records = st.session_state.extracted_data
+    cached = st.session_state.get('extracted_df_cache')
+    if cached and cached[0] is records:
+        return cached[1]
+    df = pd.DataFrame(records)
+    st.session_state.extracted_df_cache = (records, df)
+    return df
+
+
+def _review_dataframe() -> pd.DataFrame:
+    """
+    DataFrame de la révision détaillée : niveau de confiance et colonnes manquantes ajoutés
+    Construit une fois par mapping en attente (cache invalidé par l'édition manuelle)
+    """
+    records = st.session_state.pending_mapping
+    cached = st.session_state.get('review_df_cache')
+    if cached and cached[0] is records:
+        return cached[1]
+    
+    df = pd.DataFrame(records)
+    df['Confiance_Level'] = pd.cut(
+        df['confidence_score'], 
+        bins=[0, 0.5, 0.7, 0.9, 1.0],
+        labels=['Faible', 'Moyen', 'Élevé', 'Très élevé']
+    )
+    
+    # S'assurer que toutes les colonnes affichables existent (y compris en mode debug)
+    for col in ('Description', 'Date', 'Montant', 'cellule', 'sheet_name', 'tag_id'):
+        if col not in df.columns:
+            df[col] = ''
+    for col in ('labels', 'matches'):
+        if col not in df.columns:
+            df[col] = [[] for _ in range(len(df))]
+    
+    st.session_state.review_df_cache = (records, df)
+    return df
+
+
+def _workbook_sheetnames() -> Tuple[str, ...]:
+    """Noms des feuilles du classeur en session (tuple vide si aucun classeur)"""
+    wb = st.session_state.get('excel_workbook')
+    return tuple(wb.sheetnames) if wb else ()
+
+
+def _open_section(key_state: str):
+    """Marks a lazily rendered section as opened"""
+    st.session_state[key_state] = True
+
+
+def _set_state(**values):
+    """
+    Button callback: updates session state before the click's rerun
+    Replaces the "set state then st.rerun()" pattern, which cost a second full run
+    """
+    for key, value in values.items():
+        st.session_state[key] = value
+
+
+def _editor_key(name: str) -> str:
+    """Clé versionnée d'un st.data_editor (voir _reset_editor)"""
+    return f"{name}_{st.session_state.get(f'{name}_version', 0)}"
+
+
+def _reset_editor(name: str):
+    """Repart d'un éditeur sans diff : la nouvelle clé remonte le widget sur les données courantes"""
+    st.session_state[f'{name}_version'] = st.session_state.get(f'{name}_version', 0) + 1
+
+
+def _editor_has_changes(key: str) -> bool:
+    """
+    Indique si un st.data_editor a été modifié, d'après le diff qu'il garde en session
+    Évite un DataFrame.equals (parcours de toutes les cellules) à chaque rerun
+    """
+    state = st.session_state.get(key)
+    if not isinstance(state, dict):
+        return False
+    return bool(state.get('edited_rows') or state.get('added_rows') or state.get('deleted_rows'))
+
+
 class MainLayout:
     """Modern simplified layout focused on chat and Excel functionality"""
     
+    # Sections de l'espace Excel : (titre, clé, légende, méthode de rendu, ouverte par défaut)
+    _EXCEL_SECTIONS = (
+        ("**Données Excel**", "data",
+         "Visualisez et éditez vos feuilles Excel",
+         "_render_excel_data_tab", True),
+        ("**Extraction et analyse de l'extraction**", "analysis",
+         "Extrayez automatiquement les données budgétaires de vos documents",
+         "_render_excel_analysis_tab", True),
+        ("**Outil BPSS**", "tools",
+         "Traitez automatiquement vos fichiers PP-E-S, DPP18 et BUD45",
+         "_render_excel_tools_tab", False),
+    )
+    
     def __init__(self, services: Dict[str, Any]):
         self.services = services
-        self.chat_components = ChatComponents()
-        self.input_components = InputComponents()
+        self.chat_components = _CHAT_COMPONENTS
+        self.input_components = _INPUT_COMPONENTS
+        self._typing_html = _TYPING_HTML
+        self._chat_panel_html = _CHAT_PANEL_HTML
     
     def render(self, 
            on_message_send: Callable,
            on_file_upload: Callable,
            on_tool_action: Callable):
-        """Renders the complete modern application layout"""
-        
-        # Initialize layout state
-        if 'layout_mode' not in st.session_state:
-            st.session_state.layout_mode = 'chat'
-        
+        """
+        Renders the complete modern application layout
+        Session defaults (chat_history, is_typing, layout_mode...) are set by init_session_state
+        With ?profile=1 in the URL, the run is profiled (optional streamlit-profiler package)
+        """
+        with self._profiler():
+            self._render_layout(on_message_send, on_file_upload, on_tool_action)
+    
+    @staticmethod
+    def _profiler():
+        """Returns the profiling context for this run (no-op unless ?profile=1)"""
+        if st.query_params.get('profile') != '1':
+            return nullcontext()
+        try:
+            from streamlit_profiler import Profiler
+        except ImportError:
+            logger.warning("?profile=1 demandé mais streamlit-profiler n'est pas installé")
+            return nullcontext()
+        return Profiler()
+    
+    def _render_layout(self,
+                       on_message_send: Callable,
+                       on_file_upload: Callable,
+                       on_tool_action: Callable):
+        """Renders the navbar, the panels for the current layout mode and the drop overlay"""
         # Top navigation bar
         self._render_top_navbar()
         
@@ -57,157 +320,215 @@ class MainLayout:
             with col2:
                 self._render_excel_panel(on_tool_action, full_width=True)
         
-        # Drag and drop overlay
-        self._render_drag_drop_overlay()
+        # Drag and drop overlay (dépôt vers le chat : inutile en vue Excel seule)
+        if st.session_state.layout_mode != 'excel':
+            self._render_drag_drop_overlay()
     
     def _render_top_navbar(self):
         """Renders simplified top navigation bar"""
-        current_layout = st.session_state.get('layout_mode', 'chat')
+        current_layout = st.session_state.layout_mode
         
         # Create columns for navbar
         col1, col2, col3 = st.columns([2, 1, 2])
         
         with col1:
-            st.markdown("""
-            <div style="display: flex; align-items: center; gap: 0.75rem; padding: 0.5rem 0;">
-                <span style="font-size: 1.25rem; font-weight: 600; color: #1e293b;">BudgiBot</span>
-                <span style="font-size: 0.875rem; color: #64748b;">Compléteur d'excel automatique</span>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(_NAVBAR_TITLE_HTML, unsafe_allow_html=True)
         
         with col3:
             # Use Streamlit native buttons in columns
+            # Le mode est posé par callback avant le rerun du clic : pas de second rerun
             btn_col1, btn_col2, btn_col3 = st.columns(3, gap="small")
             
             with btn_col1:
-                if st.button("💬", key="nav_chat", help="Chat", 
-                        type="primary" if current_layout == 'chat' else "secondary"):
-                    st.session_state.layout_mode = 'chat'
-                    st.rerun()
+                st.button("💬", key="nav_chat", help="Chat", 
+                        type="primary" if current_layout == 'chat' else "secondary",
+                        on_click=_set_state, kwargs={'layout_mode': 'chat'})
             
             with btn_col2:
-                if st.button("⚡", key="nav_split", help="Vue partagée",
-                        type="primary" if current_layout == 'split' else "secondary"):
-                    st.session_state.layout_mode = 'split'
-                    st.rerun()
+                st.button("⚡", key="nav_split", help="Vue partagée",
+                        type="primary" if current_layout == 'split' else "secondary",
+                        on_click=_set_state, kwargs={'layout_mode': 'split'})
             
             with btn_col3:
-                if st.button("📊", key="nav_excel", help="Excel",
-                        type="primary" if current_layout == 'excel' else "secondary"):
-                    st.session_state.layout_mode = 'excel'
-                    st.rerun()
+                st.button("📊", key="nav_excel", help="Excel",
+                        type="primary" if current_layout == 'excel' else "secondary",
+                        on_click=_set_state, kwargs={'layout_mode': 'excel'})
         
         # Add a separator
-        st.markdown("<hr style='margin: 0.5rem 0 1rem 0; border: none; border-bottom: 1px solid #e2e8f0;'>", 
-                   unsafe_allow_html=True)
+        st.markdown(_NAVBAR_SEPARATOR_HTML, unsafe_allow_html=True)
     
     def _render_chat_panel(self, on_message_send: Callable, on_file_upload: Callable, 
                       full_width: bool = False):
         """Renders modern chat panel"""
         # Container wrapper
-        st.markdown(f"""
-        <div class="chat-panel{'_full' if full_width else ''}">
-            {self.chat_components.render_header()}
-        </div>
-        """, unsafe_allow_html=True)
+        st.html(self._chat_panel_html[full_width])
         
         # Messages area
         messages_container = st.container(height=500 if not full_width else 600)
         with messages_container:
             self._render_messages_area(on_message_send)
         
-        # Input area
-        st.markdown("<div style='margin-top: 1rem;'>", unsafe_allow_html=True)
+        # Input area (spacing handled by the main stylesheet)
         self._render_chat_input(on_message_send, on_file_upload)
-        st.markdown("</div>", unsafe_allow_html=True)
     
     def _render_excel_panel(self, on_tool_action: Callable, full_width: bool = False):
         """Renders Excel panel"""
         # Header
-        st.markdown(f"""
-        <div class="excel-panel{'_full' if full_width else ''}">
-            <div class="excel-header">
-                <h3>Espace Excel</h3>
-                <p style="margin: 0.5rem 0 0 0; opacity: 0.9; font-size: 0.875rem;">
-                    Ajouter un classeur, extraire des données de messages, utiliser l'outil BPSS
-                </p>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_EXCEL_PANEL_HTML[full_width], unsafe_allow_html=True)
         
         # Content sections
         with st.container():
-            # Section 1: Données
-            with st.expander("**Données Excel**", expanded=True):
-                st.caption("Visualisez et éditez vos feuilles Excel")
-                self._render_excel_data_tab(on_tool_action)  # Passer on_tool_action
-            
-            # Section 2: Extraction et Analyse
-            with st.expander("**Extraction et analyse de l'extraction**", expanded=True):
-                st.caption("Extrayez automatiquement les données budgétaires de vos documents")
-                self._render_excel_analysis_tab(on_tool_action)
-            
-            # Section 3: Outil BPSS
-            with st.expander("**Outil BPSS**", expanded=False):
-                st.caption("Traitez automatiquement vos fichiers PP-E-S, DPP18 et BUD45")
-                self._render_excel_tools_tab(on_tool_action)
+            for title, key, caption, render_name, expanded in self._EXCEL_SECTIONS:
+                self._render_tool_section(
+                    title, key, caption,
+                    getattr(self, render_name), on_tool_action,
+                    expanded=expanded
+                )
         
         # Interface de vérification si mapping disponible
         if st.session_state.get('mapping_report'):
-                st.markdown("---")
                 self._render_verification_interface(on_tool_action)
     
+    def _render_tool_section(self, title: str, key: str, caption: str,
+                             render_content: Callable[[Callable], None], on_tool_action: Callable,
+                             expanded: bool = False):
+        """Renders an expander whose content only runs once the section has been opened"""
+        key_state = f'expander_{key}_open'
+        with st.expander(title, expanded=expanded):
+            st.caption(caption)
+            if st.session_state.get(key_state, expanded):
+                render_content(on_tool_action)
+            else:
+                # Streamlit runs collapsed expander bodies: defer the tool until asked
+                st.button("Ouvrir", key=f"open_{key}", on_click=_open_section, args=(key_state,))
+    
     def _render_messages_area(self, on_message_send: Callable):
         """Renders messages area"""
-        for i, msg in enumerate(st.session_state.get('chat_history', [])):
-            # Skip hidden system messages
-            if msg.get('meta') == 'file_content':
-                continue
-            
-            # Render message
-            html, _ = self.chat_components.render_message(msg, i)
-            st.markdown(html, unsafe_allow_html=True)
-            
-            # Quick actions for assistant messages
-            if msg['role'] == 'assistant' and i == len(st.session_state.chat_history) - 1:
-                if st.session_state.get('current_file'):
-                    col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
-                    # Only show quick actions for the last assistant message
-                    with col1:
-                        if st.button("📊 Extraire", key=f"quick_extract_{i}"):
-                            st.session_state.pending_action = {'type': 'extract_budget'}
-                            st.rerun()
-
-                    with col2:
-                        if st.button("🛠️ BPSS", key=f"quick_bpss_{i}"):
-                            st.session_state.excel_tab = 'tools'
-                            st.session_state.layout_mode = 'excel'
-                            st.rerun()
-                    if st.session_state.get('is_pdf_loaded', False) and st.session_state.get('current_file', {}).get('name', '').endswith('.pdf'):
-                        with col3:
-                            if st.button("📄 → Word", key=f"convert_pdf_{i}", 
-                                        help="Convertir en document Word"):
-                                st.session_state.pending_action = {'type': 'convert_pdf'}
-                                st.rerun()
-                            # Bouton de téléchargement si conversion disponible
-            if (msg.get('has_download') and 
-                st.session_state.get('converted_docx')):
-                
-                docx_info = st.session_state.converted_docx
-                st.download_button(
-                    "📥 Télécharger le fichier Word",
-                    data=docx_info['bytes'],
-                    file_name=docx_info['filename'],
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    key=f"download_docx_{i}"
-                )
+        history = st.session_state.chat_history
+        last_index = len(history) - 1
+        
+        # Only the most recent messages are emitted; older ones are loaded on demand
+        window = st.session_state.get('chat_window', _CHAT_WINDOW)
+        first_index = max(0, len(history) - window)
+        if first_index:
+            st.button("Charger l'historique plus ancien", key="chat_load_older",
+                      on_click=_set_state, kwargs={'chat_window': window + _CHAT_WINDOW})
+        
+        widget_indices, chunks = self._message_chunks(history, first_index)
+        
+        # One st.html per run of plain bubbles, split only where a message carries widgets
+        for i, chunk in zip(widget_indices, chunks):
+            if chunk:
+                st.html(chunk)
+            self._render_message_widgets(history[i], i, last_index)
+        if chunks[-1]:
+            st.html(chunks[-1])
+    
+    def _message_chunks(self, history, first_index: int) -> Tuple[list, list]:
+        """
+        Joined bubble HTML between widget-bearing messages, reused while the history is unchanged
+        Returns: (indices of messages followed by widgets, HTML chunks - one more than indices)
+        """
+        is_typing = st.session_state.is_typing
+        fingerprint = (st.session_state.get('chat_revision', 0), len(history), first_index, is_typing)
+        cached = st.session_state.get('_chat_chunks')
+        if cached and cached[0] == fingerprint:
+            return cached[1], cached[2]
+        
+        html_cache, download_indices = self._rendered_messages(history)
+        last_index = len(history) - 1
+        
+        # Only the tail message and download messages carry widgets: visit those, not the whole history
+        widget_indices = [i for i in download_indices if i >= first_index]
+        if last_index >= 0 and self._message_has_widgets(history[last_index], last_index, last_index) \
+                and last_index not in download_indices:
+            widget_indices.append(last_index)
+        
+        chunks = []
+        start = first_index
+        for i in widget_indices:
+            chunks.append("".join(islice(html_cache, start, i + 1)))
+            start = i + 1
+        
+        # Remaining bubbles and typing indicator
+        tail = "".join(islice(html_cache, start, None))
+        chunks.append(tail + self._typing_html if is_typing else tail)
+        
+        st.session_state['_chat_chunks'] = (fingerprint, widget_indices, chunks)
+        return widget_indices, chunks
+    
+    def _rendered_messages(self, history) -> Tuple[list, list]:
+        """
+        Per-message HTML for the history, rendering only messages appended since the last rerun
+        The history is append-only; edits or resets bump chat_revision to invalidate the prefix
+        Returns: (HTML per message, indices of messages with a download button)
+        """
+        revision = st.session_state.get('chat_revision', 0)
+        cached_revision, html_cache, download_indices = st.session_state.get(
+            '_rendered_history', (None, [], [])
+        )
+        if cached_revision != revision or len(html_cache) > len(history):
+            html_cache, download_indices = [], []
+        
+        if len(html_cache) < len(history):
+            start = len(html_cache)
+            html_cache = html_cache + self.chat_components.render_message_fragments(
+                islice(history, start, None)
+            )
+            download_indices = download_indices + [
+                i for i, msg in enumerate(islice(history, start, None), start)
+                if msg.get('has_download') and msg.get('meta') != 'file_content'
+            ]
+            st.session_state['_rendered_history'] = (revision, html_cache, download_indices)
+        
+        return html_cache, download_indices
+    
+    @staticmethod
+    def _message_has_widgets(msg: Dict, index: int, last_index: int) -> bool:
+        """Whether a message is followed by Streamlit widgets"""
+        if msg.get('meta') == 'file_content':
+            return False
+        return (msg['role'] == 'assistant' and index == last_index) or bool(msg.get('has_download'))
+    
+    def _render_message_widgets(self, msg: Dict, i: int, last_index: int):
+        """Renders the buttons attached to a message"""
+        # Quick actions for assistant messages
+        if msg['role'] == 'assistant' and i == last_index:
+            if st.session_state.get('current_file'):
+                col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
+                # Only show quick actions for the last assistant message
+                with col1:
+                    st.button("📊 Extraire", key=f"quick_extract_{i}", on_click=_set_state,
+                              kwargs={'pending_action': {'type': 'extract_budget'}})
 
-        # Typing indicator
-        if st.session_state.get('is_typing', False):
-            st.markdown(self.chat_components.render_typing_indicator(), unsafe_allow_html=True)
+                with col2:
+                    st.button("🛠️ BPSS", key=f"quick_bpss_{i}", on_click=_set_state,
+                              kwargs={'excel_tab': 'tools', 'layout_mode': 'excel'})
+                if st.session_state.get('is_pdf_loaded', False) and st.session_state.get('current_file', {}).get('name', '').endswith('.pdf'):
+                    with col3:
+                        st.button("📄 → Word", key=f"convert_pdf_{i}", 
+                                  help="Convertir en document Word", on_click=_set_state,
+                                  kwargs={'pending_action': {'type': 'convert_pdf'}})
+        
+        # Bouton de téléchargement si conversion disponible
+        if (msg.get('has_download') and 
+            st.session_state.get('converted_docx')):
+            
+            docx_info = st.session_state.converted_docx
+            st.download_button(
+                "📥 Télécharger le fichier Word",
+                data=docx_info['bytes'],
+                file_name=docx_info['filename'],
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                key=f"download_docx_{i}"
+            )
     
+    @st.fragment
     def _render_chat_input(self, on_message_send: Callable, on_file_upload: Callable):
-        """Renders simplified chat input"""
+        """
+        Renders simplified chat input
+        Runs as a fragment: picking a file only reruns this block, the handlers trigger the full rerun
+        """
         col1, col2 = st.columns([4, 1])
         
         with col1:
@@ -231,10 +552,9 @@ class MainLayout:
             on_message_send(prompt)
         
         if uploaded_file:
-            # Prevent duplicate uploads
-            file_key = f"{uploaded_file.name}_{uploaded_file.size}"
-            if 'last_file_key' not in st.session_state or st.session_state.last_file_key != file_key:
-                st.session_state.last_file_key = file_key
+            # Prevent duplicate uploads (file_id differs for each upload, even with the same name)
+            if st.session_state.get('last_file_key') != uploaded_file.file_id:
+                st.session_state.last_file_key = uploaded_file.file_id
                 on_file_upload(uploaded_file)
     
     def _render_excel_data_tab(self, on_tool_action: Callable):
@@ -249,12 +569,13 @@ class MainLayout:
             
             if uploaded:
                 try:
-                    wb = self.services['excel_handler'].load_workbook_from_bytes(uploaded.getbuffer())
+                    # Une seule copie des octets, partagée par le chargement et la session
+                    raw_bytes = uploaded.getvalue()
+                    wb = self.services['excel_handler'].load_workbook_from_bytes(raw_bytes)
                     st.session_state.excel_workbook = wb
                     st.session_state.current_file = {
                         'name': uploaded.name,
-                        'content': uploaded.getbuffer(),
-                        'raw_bytes': uploaded.getbuffer()
+                        'raw_bytes': raw_bytes
                     }
                     st.rerun()
                 except Exception as e:
@@ -288,7 +609,6 @@ class MainLayout:
                     # Nettoyer les données en cache pour forcer le rechargement
                     if 'excel_data_cache' in st.session_state:
                         del st.session_state.excel_data_cache
-                    st.rerun()
 
             with col2:
                 # Toggle valeurs/formules
@@ -314,108 +634,12 @@ class MainLayout:
                         st.caption(f"⚠️ {len(errors)} erreurs")
 
             with col5:
-                st.download_button(
-                    "💾",
-                    data=self.services['excel_handler'].save_workbook_to_bytes(wb),
-                    file_name=f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                self._render_workbook_download(wb, "💾", "📦", "export", key="download_excel_main")
                         
             # Display data
             if selected_sheet:
                 try:
-                    # Charger les données de la feuille
-                    df = self.services['excel_handler'].sheet_to_dataframe(
-                        wb, 
-                        selected_sheet,
-                        show_formulas=(display_mode == "Formules")
-                    )
-                    
-                    # Assurer que le DataFrame a une taille minimale pour l'édition
-                    if df.empty or len(df) < 20 or len(df.columns) < 10:
-                        # Étendre le DataFrame
-                        min_rows = max(20, len(df))
-                        min_cols = max(10, len(df.columns))
-                        
-                        # Créer un nouveau DataFrame avec la taille minimale
-                        new_df = pd.DataFrame(index=range(min_rows), columns=range(min_cols))
-                        
-                        # Copier les données existantes
-                        if not df.empty:
-                            for i in range(min(len(df), min_rows)):
-                                for j in range(min(len(df.columns), min_cols)):
-                                    new_df.iloc[i, j] = df.iloc[i, j] if i < len(df) and j < len(df.columns) else None
-                        
-                        df = new_df
-                    
-                    # Simple info avec debug info
-                    debug_info = f"ID: {editor_key}" if st.session_state.get('debug_mode', False) else ""
-                    
-                    # Vérifier si des formules sont présentes dans les données affichées
-                    has_formulas = False
-                    if display_mode == "Valeurs":
-                        for col in df.columns:
-                            if df[col].astype(str).str.startswith('[=', na=False).any():
-                                has_formulas = True
-                                break
-                    
-                    caption_text = f"📊 {selected_sheet} - {len(df)} lignes × {len(df.columns)} colonnes {debug_info}"
-                    if has_formulas and display_mode == "Valeurs":
-                        caption_text += " ⚠️ Formules détectées (valeurs non calculées)"
-                    
-                    st.caption(caption_text)
-                    
-                    # Créer une clé unique pour chaque combinaison feuille + mode
-                    editor_key = f"excel_editor_{selected_sheet}_{display_mode}"
-                    
-                    # Configuration du data editor
-                    column_config = {}
-                    for col in df.columns:
-                        column_config[col] = st.column_config.TextColumn(
-                            str(col),
-                            help=f"Colonne {col}",
-                            default="",
-                            max_chars=None,
-                            validate=None
-                        )
-                    
-                    # Data editor avec configuration améliorée
-                    edited_df = st.data_editor(
-                        df,
-                        use_container_width=True,
-                        height=400,
-                        num_rows="dynamic",
-                        key=editor_key,
-                        column_config=column_config,
-                        hide_index=False,
-                        disabled=False  # S'assurer que l'édition est activée
-                    )
-                    
-                    # Bouton de sauvegarde toujours visible pour éviter les problèmes de détection
-                    col1, col2, col3 = st.columns([1, 2, 1])
-                    with col2:
-                        if st.button("💾 Sauvegarder les modifications", 
-                                type="primary", 
-                                use_container_width=True,
-                                key=f"save_btn_{selected_sheet}"):
-                            try:
-                                # Sauvegarder les modifications
-                                self.services['excel_handler'].dataframe_to_sheet(
-                                    edited_df, wb, selected_sheet
-                                )
-                                
-                                # Mettre à jour le workbook en session
-                                st.session_state.excel_workbook = wb
-                                
-                                st.success(f"✅ Modifications sauvegardées dans {selected_sheet}!")
-                                
-                                # Forcer le rechargement pour afficher les nouvelles valeurs
-                                time.sleep(0.5)
-                                st.rerun()
-                                
-                            except Exception as e:
-                                st.error(f"❌ Erreur lors de la sauvegarde: {str(e)}")
-                                logger.error(f"Erreur sauvegarde: {str(e)}", exc_info=True)
+                    self._render_sheet_editor(wb, selected_sheet, display_mode)
                     
                     # Aide pour l'utilisateur - utiliser info au lieu d'expander
                     st.info("""
@@ -495,27 +719,12 @@ class MainLayout:
                             with tab3:
                                 # Exemples de formules converties
                                 if formulas.get('formulas'):
-                                    examples = [f for f in formulas['formulas'] if f.python_code and not f.error][:5]
+                                    examples = list(islice(
+                                        (f for f in formulas['formulas'] if f.python_code and not f.error), 5
+                                    ))
                                     if examples:
-                                        for i, f in enumerate(examples):
-                                            st.markdown(f"### {f.sheet}!{f.address}")
-                                            
-                                            # Utiliser des colonnes au lieu d'expander
-                                            col1, col2 = st.columns(2)
-                                            
-                                            with col1:
-                                                st.markdown("**Formule Excel:**")
-                                                st.code(f.formula, language="excel")
-                                            
-                                            with col2:
-                                                st.markdown("**Code Python:**")
-                                                st.code(f.python_code, language="python")
-                                            
-                                            # Afficher la valeur si disponible
-                                            if hasattr(f, 'value') and f.value is not None:
-                                                st.success(f"Valeur calculée: {f.value}")
-                                            
-                                            st.markdown("---")
+                                        # Tous les exemples en un seul bloc markdown
+                                        st.markdown(self._formula_examples_markdown(examples))
                                     else:
                                         st.info("Aucun exemple disponible (toutes les formules ont des erreurs)")
                                 else:
@@ -525,6 +734,171 @@ class MainLayout:
                     st.error(f"Erreur affichage: {str(e)}")
                     logger.error(f"Erreur affichage feuille {selected_sheet}: {str(e)}", exc_info=True)
     
+    @staticmethod
+    def _formula_examples_markdown(examples) -> str:
+        """Construit le markdown des exemples de formules converties (formule Excel, code Python, valeur)"""
+        blocks = []
+        for f in examples:
+            block = (
+                f"### {f.sheet}!{f.address}\n\n"
+                f"**Formule Excel:**\n```excel\n{f.formula}\n```\n\n"
+                f"**Code Python:**\n```python\n{f.python_code}\n```"
+            )
+            # Afficher la valeur si disponible
+            if getattr(f, 'value', None) is not None:
+                block += f"\n\n✅ Valeur calculée: `{f.value}`"
+            blocks.append(block)
+        return "\n\n---\n\n".join(blocks)
+    
+    @st.fragment
+    def _render_sheet_editor(self, wb, selected_sheet: str, display_mode: str):
+        """
+        Éditeur de la feuille sélectionnée
+        Exécuté en fragment : une édition de cellule ne relance que ce bloc,
+        la sauvegarde relance toute l'application
+        """
+        try:
+            # Charger les données de la feuille (conversion mise en cache)
+            df = self._sheet_dataframe(wb, selected_sheet, display_mode == "Formules")
+            
+            # Simple info avec debug info
+            debug_info = f"ID: {editor_key}" if st.session_state.get('debug_mode', False) else ""
+            
+            # Vérifier si des formules sont présentes dans les données affichées
+            has_formulas = False
+            if display_mode == "Valeurs":
+                for col in df.columns:
+                    if df[col].astype(str).str.startswith('[=', na=False).any():
+                        has_formulas = True
+                        break
+            
+            caption_text = f"📊 {selected_sheet} - {len(df)} lignes × {len(df.columns)} colonnes {debug_info}"
+            if has_formulas and display_mode == "Valeurs":
+                caption_text += " ⚠️ Formules détectées (valeurs non calculées)"
+            
+            st.caption(caption_text)
+            
+            # Créer une clé unique pour chaque combinaison feuille + mode
+            editor_key = f"excel_editor_{selected_sheet}_{display_mode}"
+            
+            # Configuration du data editor
+            column_config = {}
+            for col in df.columns:
+                column_config[col] = st.column_config.TextColumn(
+                    str(col),
+                    help=f"Colonne {col}",
+                    default="",
+                    max_chars=None,
+                    validate=None
+                )
+            
+            # Data editor avec configuration améliorée
+            edited_df = st.data_editor(
+                df,
+                use_container_width=True,
+                height=400,
+                num_rows="dynamic",
+                key=editor_key,
+                column_config=column_config,
+                hide_index=False,
+                disabled=False  # S'assurer que l'édition est activée
+            )
+            
+            # Bouton de sauvegarde toujours visible pour éviter les problèmes de détection
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col2:
+                if st.button("💾 Sauvegarder les modifications", 
+                        type="primary", 
+                        use_container_width=True,
+                        key=f"save_btn_{selected_sheet}"):
+                    try:
+                        # Sauvegarder les modifications
+                        self.services['excel_handler'].dataframe_to_sheet(
+                            edited_df, wb, selected_sheet
+                        )
+                        
+                        # Mettre à jour le workbook en session
+                        st.session_state.excel_workbook = wb
+                        
+                        st.success(f"✅ Modifications sauvegardées dans {selected_sheet}!")
+                        
+                        # Forcer le rechargement pour afficher les nouvelles valeurs
+                        time.sleep(0.5)
+                        st.rerun()
+                        
+                    except Exception as e:
+                        st.error(f"❌ Erreur lors de la sauvegarde: {str(e)}")
+                        logger.error(f"Erreur sauvegarde: {str(e)}", exc_info=True)
+        
+        except Exception as e:
+            st.error(f"Erreur affichage: {str(e)}")
+            logger.error(f"Erreur affichage feuille {selected_sheet}: {str(e)}", exc_info=True)
+    
+    def _sheet_dataframe(self, wb, sheet_name: str, show_formulas: bool) -> pd.DataFrame:
+        """
+        Convertit une feuille en DataFrame éditable, une fois par version du classeur
+        Chaque modification du classeur passe par un nouveau fichier temporaire (current_path),
+        qui sert donc de numéro de version dans la clé du cache
+        """
+        excel_handler = self.services['excel_handler']
+        cache_key = (id(wb), excel_handler.current_path, sheet_name, show_formulas)
+        cached = st.session_state.get('excel_data_cache')
+        if cached and cached[0] == cache_key:
+            return cached[1]
+        
+        df = excel_handler.sheet_to_dataframe(wb, sheet_name, show_formulas=show_formulas)
+        
+        # Assurer que le DataFrame a une taille minimale pour l'édition
+        if df.empty or len(df) < 20 or len(df.columns) < 10:
+            # Étendre le DataFrame
+            min_rows = max(20, len(df))
+            min_cols = max(10, len(df.columns))
+            
+            # Créer un nouveau DataFrame avec la taille minimale
+            new_df = pd.DataFrame(index=range(min_rows), columns=range(min_cols))
+            
+            # Copier les données existantes
+            if not df.empty:
+                for i in range(min(len(df), min_rows)):
+                    for j in range(min(len(df.columns), min_cols)):
+                        new_df.iloc[i, j] = df.iloc[i, j] if i < len(df) and j < len(df.columns) else None
+            
+            df = new_df
+        
+        st.session_state.excel_data_cache = (cache_key, df)
+        return df
+    
+    def _render_workbook_download(self, wb, label: str, prepare_label: str, file_prefix: str,
+                                  key: str, **button_kwargs):
+        """
+        Bouton de téléchargement du classeur, sérialisé seulement à la demande
+        Les octets sont conservés tant que le classeur n'a pas changé (même clé que excel_data_cache)
+        """
+        excel_handler = self.services['excel_handler']
+        export_key = (id(wb), excel_handler.current_path)
+        pending = st.session_state.get('pending_export')
+        
+        if not pending or pending[0] != export_key:
+            if st.button(prepare_label, key=f"prepare_{key}",
+                         help="Préparer le fichier Excel à télécharger", **button_kwargs):
+                st.session_state.pending_export = (
+                    export_key,
+                    excel_handler.save_workbook_to_bytes(wb),
+                    datetime.now().strftime('%Y%m%d_%H%M%S')
+                )
+                st.rerun()
+            return
+        
+        _, excel_bytes, timestamp = pending
+        st.download_button(
+            label,
+            data=excel_bytes,
+            file_name=f"{file_prefix}_{timestamp}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key=key,
+            **button_kwargs
+        )
+    
     def _render_excel_analysis_tab(self, on_tool_action: Callable):
         """Renders simplified analysis tab"""
         # Check prerequisites
@@ -541,10 +915,15 @@ class MainLayout:
         )
         
         if json_file:
-            import json
             try:
-                data = json.load(json_file)
-                st.session_state.json_data = data
+                # Parser une seule fois par upload : les labels actualisés ne sont plus écrasés au rerun
+                if st.session_state.get('json_file_id') != json_file.file_id:
+                    raw = json_file.getvalue()
+                    st.session_state.json_data = _load_json_config(
+                        hashlib.blake2b(raw, digest_size=8).digest(), raw
+                    )
+                    st.session_state.json_file_id = json_file.file_id
+                data = st.session_state.json_data
                 tags_count = len(data.get('tags', []))
                 st.success(f"✅ Configuration JSON chargée ({tags_count} cellules cibles)")
                 
@@ -614,29 +993,32 @@ class MainLayout:
                         )
                 
                 # Afficher les détails APRÈS les colonnes (pas d'expander car on est déjà dans un expander)
-                if st.session_state.get('show_modification_details', False):
-                    st.markdown("---")
-                    st.markdown("### 📋 Détails des modifications")
+                state = st.session_state
+                if state.get('show_modification_details', False):
+                    actual_modifications = state.get('actual_modifications', [])
+                    cleanup_info = state.get('cleanup_info')
                     
-                    actual_modifications = st.session_state.get('actual_modifications', [])
-                    cleanup_info = st.session_state.get('cleanup_info')
-                    duplicates_before = st.session_state.get('duplicates_before', [])
+                    # Détails assemblés puis émis en un seul bloc markdown
+                    lines = ["---", "### 📋 Détails des modifications"]
                     
                     if actual_modifications:
-                        st.markdown("**Labels ajoutés :**")
+                        lines.append("**Labels ajoutés :**")
                         for mod in actual_modifications:
-                            st.markdown(f"**{mod['sheet']}!{mod['cell']}** : +{len(mod['added_labels'])} labels")
-                            for label in mod['added_labels'][:5]:
-                                st.markdown(f"  • {label}")
+                            lines.append(f"**{mod['sheet']}!{mod['cell']}** : +{len(mod['added_labels'])} labels")
+                            lines.extend(f"  • {label}" for label in mod['added_labels'][:5])
                             if len(mod['added_labels']) > 5:
-                                st.markdown(f"  • ... et {len(mod['added_labels']) - 5} autres")
+                                lines.append(f"  • ... et {len(mod['added_labels']) - 5} autres")
                     
                     if cleanup_info:
-                        st.markdown("---")
-                        st.markdown(f"**Nettoyage effectué :**")
-                        st.markdown(f"• Tags avant nettoyage : {cleanup_info['remaining_tags'] + cleanup_info['removed_duplicates']}")
-                        st.markdown(f"• Tags après nettoyage : {cleanup_info['remaining_tags']}")
-                        st.markdown(f"• Doublons supprimés : {cleanup_info['removed_duplicates']}")
+                        lines.extend((
+                            "---",
+                            "**Nettoyage effectué :**",
+                            f"• Tags avant nettoyage : {cleanup_info['remaining_tags'] + cleanup_info['removed_duplicates']}",
+                            f"• Tags après nettoyage : {cleanup_info['remaining_tags']}",
+                            f"• Doublons supprimés : {cleanup_info['removed_duplicates']}",
+                        ))
+                    
+                    st.markdown("\n\n".join(lines))
                         
             except Exception as e:
                 st.error(f"Erreur JSON: {str(e)}")
@@ -644,54 +1026,65 @@ class MainLayout:
         # Main extraction button
         st.markdown("---")
         
+        # current_file est garanti par le retour anticipé en tête de méthode
         if st.button("🎯 Extraire les données budgétaires", 
                     type="primary", 
-                    use_container_width=True,
-                    disabled=not st.session_state.get('current_file')):
+                    use_container_width=True):
             on_tool_action({'action': 'extract_budget'})
         
         # Display extracted data if available
         if st.session_state.get('extracted_data'):
             st.markdown("### Données extraites")
             
-            df = pd.DataFrame(st.session_state.extracted_data)
+            self._render_extracted_data_editor()
             
-            # Summary metrics
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Entrées", len(df))
-            
-            # Editable data
-            edited_df = st.data_editor(
-                df,
-                use_container_width=True,
-                num_rows="dynamic",
-                height=300,
-                key="budget_data_editor"
+            # Hors du fragment : le mapping alimente la vérification et le chat, qui doivent
+            # se mettre à jour dans le même run que le clic
+            if st.session_state.get('json_data') and st.session_state.get('excel_workbook'):
+                if st.button("🎯 Mapper vers Excel", use_container_width=True, type="secondary"):
+                    on_tool_action({'action': 'map_budget_cells'})
+    
+    @st.fragment
+    def _render_extracted_data_editor(self):
+        """
+        Éditeur des données extraites, exécuté en fragment comme l'éditeur de feuille
+        Les actions qui modifient d'autres zones (mapping) restent hors du fragment
+        """
+        df = _extracted_dataframe()
+        
+        # Summary metrics
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Entrées", len(df))
+        
+        # Editable data
+        edited_df = st.data_editor(
+            df,
+            use_container_width=True,
+            num_rows="dynamic",
+            height=300,
+            key=_editor_key("budget_data_editor")
+        )
+        
+        # CSV généré seulement à la demande, depuis l'état courant de l'éditeur
+        if st.button("📥 Exporter CSV", use_container_width=True, key="prepare_budget_csv"):
+            st.download_button(
+                "📥 Télécharger CSV",
+                data=edited_df.to_csv(index=False).encode('utf-8'),
+                file_name=f"budget_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv",
+                use_container_width=True
             )
-            
-            # Action buttons
-            col1, col2 = st.columns(2)
-            with col1:
-                csv = edited_df.to_csv(index=False)
-                st.download_button(
-                    "📥 Exporter CSV",
-                    data=csv,
-                    file_name=f"budget_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-            
-            with col2:
-                if st.session_state.get('json_data') and st.session_state.get('excel_workbook'):
-                    if st.button("🎯 Mapper vers Excel", use_container_width=True, type="secondary"):
-                        on_tool_action({'action': 'map_budget_cells'})
-                        
-            # Save changes if modified
-            if not df.equals(edited_df):
-                if st.button("💾 Sauvegarder les modifications", use_container_width=True):
-                    st.session_state.extracted_data = edited_df.to_dict('records')
-                    st.success("✅ Données mises à jour!")
+        
+        # Save changes if modified
+        if _editor_has_changes(_editor_key("budget_data_editor")):
+            if st.button("💾 Sauvegarder les modifications", use_container_width=True):
+                st.session_state.extracted_data = edited_df.to_dict('records')
+                # Diff consommé : sans nouvelle clé, le bouton resterait affiché après la sauvegarde
+                _reset_editor("budget_data_editor")
+                st.toast("✅ Données mises à jour!")
+                # Rerun complet : la vue d'ensemble, hors fragment, lit aussi extracted_data
+                st.rerun()
     
     def _render_excel_tools_tab(self, on_tool_action: Callable):
         """Renders simplified BPSS tool"""
@@ -766,64 +1159,29 @@ class MainLayout:
         has_pending = st.session_state.get('pending_mapping') is not None
         report = st.session_state.mapping_report
         
-        # Header avec style
-        st.markdown("""
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                    padding: 2rem; border-radius: 10px; margin-bottom: 2rem;">
-            <h2 style="color: white; margin: 0;">🔍 Vérification et Validation du Mapping</h2>
-            <p style="color: rgba(255,255,255,0.9); margin: 0.5rem 0 0 0;">
-                Vérifiez que les données budgétaires sont correctement associées aux cellules Excel
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
+        # Séparateur, header et carte de statut émis en un seul bloc
+        status_html = _APPLIED_STATUS_HTML if is_applied else _PENDING_STATUS_HTML if has_pending else ""
+        st.markdown(_VERIFICATION_HEADER_HTML + "\n" + status_html, unsafe_allow_html=True)
         
         # Statut avec cards modernes
         if is_applied:
-            st.markdown("""
-            <div style="background: #d4edda; border: 1px solid #c3e6cb; 
-                        border-radius: 8px; padding: 1.5rem; margin-bottom: 1rem;">
-                <h3 style="color: #155724; margin: 0;">✅ Mapping Appliqué avec Succès!</h3>
-                <p style="color: #155724; margin: 0.5rem 0 0 0;">
-                    Les données ont été écrites dans votre fichier Excel.
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-            
             # Actions post-mapping
             col1, col2 = st.columns(2)
             with col1:
                 if st.session_state.get('excel_workbook'):
-                    excel_bytes = self.services['excel_handler'].save_workbook_to_bytes(
-                        st.session_state.excel_workbook
-                    )
-                    st.download_button(
-                        "📥 Télécharger Excel mis à jour",
-                        data=excel_bytes,
-                        file_name=f"excel_mapping_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    self._render_workbook_download(
+                        st.session_state.excel_workbook,
+                        "📥 Télécharger Excel mis à jour", "📦 Préparer l'Excel mis à jour",
+                        "excel_mapping", key="download_excel_mapping",
                         use_container_width=True,
                         type="primary"
                     )
             
             with col2:
-                if st.button("🔄 Nouveau mapping", use_container_width=True):
-                    st.session_state.pending_mapping = None
-                    st.session_state.mapping_report = None
-                    st.session_state.mapping_validated = False
-                    st.rerun()
+                st.button("🔄 Nouveau mapping", use_container_width=True,
+                          on_click=_set_state, kwargs=_MAPPING_RESET)
                     
         elif has_pending:
-            # Carte d'état en attente
-            st.markdown("""
-            <div style="background: #fff3cd; border: 1px solid #ffeaa7; 
-                        border-radius: 8px; padding: 1.5rem; margin-bottom: 1rem;">
-                <h3 style="color: #856404; margin: 0;">⏳ Validation Requise</h3>
-                <p style="color: #856404; margin: 0.5rem 0 0 0;">
-                    Vérifiez les associations proposées avant d'appliquer le mapping.
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-            
             # Actions principales
             col1, col2, col3, col4 = st.columns([3, 3, 2, 2])
             
@@ -835,26 +1193,23 @@ class MainLayout:
                     on_tool_action({'action': 'apply_validated_mapping'})
             
             with col2:
-                if st.button("🔄 Refaire l'analyse", 
-                            type="secondary",
-                            use_container_width=True,
-                            help="Relance le mapping avec de nouveaux paramètres"):
-                    st.session_state.pending_mapping = None
-                    st.session_state.mapping_report = None
-                    st.session_state.mapping_validated = False
-                    st.rerun()
+                st.button("🔄 Refaire l'analyse", 
+                          type="secondary",
+                          use_container_width=True,
+                          help="Relance le mapping avec de nouveaux paramètres",
+                          on_click=_set_state, kwargs=_MAPPING_RESET)
             
             with col3:
-                # Export pour révision
-                mapping_df = pd.DataFrame(st.session_state.pending_mapping)
-                csv = mapping_df.to_csv(index=False)
-                st.download_button(
-                    "📊 Export CSV",
-                    data=csv,
-                    file_name=f"mapping_review_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
+                # Export pour révision, construit seulement à la demande (nom horodaté au clic)
+                if st.button("📊 Export CSV", use_container_width=True, key="prepare_mapping_csv"):
+                    mapping_df = pd.DataFrame(st.session_state.pending_mapping)
+                    st.download_button(
+                        "📥 Télécharger CSV",
+                        data=mapping_df.to_csv(index=False).encode('utf-8'),
+                        file_name=f"mapping_review_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
             
             with col4:
                 # Mode debug
@@ -863,54 +1218,28 @@ class MainLayout:
         # Métriques visuelles améliorées
         st.markdown("---")
         
+        # Sections du rapport lues une fois pour la jauge, les barres et les métriques
+        summary = report['summary']
+        by_confidence = report['by_confidence']
+        
         # Graphique de synthèse
         col1, col2 = st.columns([1, 2])
         
         with col1:
             # Gauge de confiance
-            avg_conf = report['summary']['average_confidence']
+            avg_conf = summary['average_confidence']
             color = "#28a745" if avg_conf > 0.8 else "#ffc107" if avg_conf > 0.6 else "#dc3545"
             
-            st.markdown(f"""
-            <div style="text-align: center; padding: 1rem;">
-                <div style="position: relative; width: 150px; height: 150px; margin: 0 auto;">
-                    <svg viewBox="0 0 36 36" style="width: 100%; height: 100%;">
-                        <path d="M18 2.0845 a 15.9155 15.9155 0 0 1 0 31.831 a 15.9155 15.9155 0 0 1 0 -31.831"
-                            fill="none" stroke="#eee" stroke-width="3"/>
-                        <path d="M18 2.0845 a 15.9155 15.9155 0 0 1 0 31.831 a 15.9155 15.9155 0 0 1 0 -31.831"
-                            fill="none" stroke="{color}" stroke-width="3"
-                            stroke-dasharray="{avg_conf * 100}, 100"/>
-                        <text x="18" y="20.35" style="font-size: 10px; text-anchor: middle; fill: #333;">
-                            {avg_conf:.0%}
-                        </text>
-                    </svg>
-                </div>
-                <h4 style="margin-top: 1rem;">Confiance Moyenne</h4>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(_CONFIDENCE_GAUGE_TEMPLATE.substitute(
+                color=color, dash=avg_conf * 100, label=f"{avg_conf:.0%}"
+            ), unsafe_allow_html=True)
         
         with col2:
-            # Barres de progression par catégorie
-            st.markdown("### 📊 Distribution de la Confiance")
-            
-            confidence_data = []
-            colors = ['#28a745', '#90EE90', '#ffc107', '#dc3545']
-            
-            for i, (level, count) in enumerate(report['by_confidence'].items()):
-                if count > 0:
-                    percentage = (count / report['summary']['total_entries']) * 100
-                    st.markdown(f"""
-                    <div style="margin-bottom: 1rem;">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 0.25rem;">
-                            <span>{level}</span>
-                            <span style="font-weight: bold;">{count} ({percentage:.1f}%)</span>
-                        </div>
-                        <div style="background: #e0e0e0; height: 25px; border-radius: 5px; overflow: hidden;">
-                            <div style="width: {percentage}%; height: 100%; background: {colors[i % len(colors)]}; 
-                                        transition: width 0.5s ease;"></div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+            # Barres de progression par catégorie, émises avec le titre en un seul bloc
+            st.markdown(_confidence_distribution_markdown(
+                tuple(by_confidence.items()),
+                summary['total_entries']
+            ), unsafe_allow_html=True)
         
         # Statistiques clés
         st.markdown("---")
@@ -919,32 +1248,29 @@ class MainLayout:
         with col1:
             st.metric(
                 "📋 Total entrées", 
-                report['summary']['total_entries'],
+                summary['total_entries'],
                 help="Nombre total d'entrées budgétaires à mapper"
             )
         
         with col2:
             st.metric(
                 "✅ Mappées", 
-                report['summary']['mapped_entries'],
-                f"+{report['summary']['mapping_rate']:.1f}%",
+                summary['mapped_entries'],
+                f"+{summary['mapping_rate']:.1f}%",
                 help="Entrées avec une cellule cible identifiée"
             )
         
         with col3:
             st.metric(
                 "⚠️ À vérifier", 
-                sum([
-                    report['by_confidence'].get('Moyen (50-70%)', 0),
-                    report['by_confidence'].get('Faible (<50%)', 0)
-                ]),
+                by_confidence.get('Moyen (50-70%)', 0) + by_confidence.get('Faible (<50%)', 0),
                 help="Mappings nécessitant une validation manuelle"
             )
         
         with col4:
             st.metric(
                 "❌ Non mappées", 
-                report['summary']['unmapped_entries'],
+                summary['unmapped_entries'],
                 help="Entrées sans cellule cible trouvée"
             )
         
@@ -1018,104 +1344,132 @@ class MainLayout:
         
         # Préparer les données filtrées
         mappings = st.session_state.get('pending_mapping', [])
-        filtered_mappings = mappings
-        
-        # Appliquer les filtres
-        if confidence_filter != "Tous":
-            if confidence_filter == "Haute (>70%)":
-                filtered_mappings = [m for m in filtered_mappings if m.get('confidence_score', 0) > 0.7]
-            elif confidence_filter == "Moyenne (50-70%)":
-                filtered_mappings = [m for m in filtered_mappings if 0.5 <= m.get('confidence_score', 0) <= 0.7]
-            else:
-                filtered_mappings = [m for m in filtered_mappings if m.get('confidence_score', 0) < 0.5]
-        
-        if sheet_filter != "Toutes":
-            filtered_mappings = [m for m in filtered_mappings if m.get('sheet_name') == sheet_filter]
         
-        if search:
-            filtered_mappings = [m for m in filtered_mappings if search.lower() in m.get('Description', '').lower()]
+        # Appliquer les filtres en un seul passage (la description n'est normalisée que si nécessaire)
+        confidence_ok = {
+            "Haute (>70%)": lambda c: c > 0.7,
+            "Moyenne (50-70%)": lambda c: 0.5 <= c <= 0.7,
+            "Faible (<50%)": lambda c: c < 0.5,
+        }.get(confidence_filter)
+        needle = search.casefold()
+        filtered_mappings = [
+            m for m in mappings
+            if (confidence_ok is None or confidence_ok(m.get('confidence_score', 0)))
+            and (sheet_filter == "Toutes" or m.get('sheet_name') == sheet_filter)
+            and (not needle or needle in m.get('Description', '').casefold())
+        ]
         
         # Affichage des mappings
         st.markdown(f"**{len(filtered_mappings)} associations à valider**")
         
-        # Container scrollable
-        container = st.container()
-        with container:
-            for idx, mapping in enumerate(filtered_mappings[:20]):  # Limiter à 20 pour la performance
-                # Carte de mapping
-                confidence = mapping.get('confidence_score', 0)
-                conf_color = "#28a745" if confidence > 0.7 else "#ffc107" if confidence > 0.5 else "#dc3545"
-
-                date_info = f" ({mapping.get('Date', '')})" if mapping.get('Date') else ""                
-
-                with st.expander(
-                    f"📄 {mapping.get('Description', '')[:60]}... → 📊 {mapping.get('cellule', 'Non défini')}", 
-                    expanded=(idx < 3)  # Étendre les 3 premiers
-                ):
-                    # Layout en colonnes
-                    col1, col2 = st.columns([3, 2])
-                    
-                    with col1:
-                        # Informations source
-                        st.markdown("**📥 Entrée Budgétaire**")
-                        st.markdown(f"**Description:** {mapping.get('Description', 'N/A')}")
-                        st.markdown(f"**Montant:** {mapping.get('Montant', 0):,.2f} €")
-                        if mapping.get('Axe'):
-                            st.markdown(f"**Axe:** {mapping.get('Axe')}")
-                        if mapping.get('Nature'):
-                            st.markdown(f"**Nature:** {mapping.get('Nature')}")
-                        if mapping.get('Date'):
-                            st.markdown(f"**📅 Date/Année:** {mapping.get('Date')}")
-                        if mapping.get('SourcePhrase'):
-                            with st.expander("📝 Phrase source"):
-                                st.text(mapping.get('SourcePhrase'))
-                    
-                    with col2:
-                        # Informations cible
-                        st.markdown("**📊 Cellule Excel Cible**")
-                        st.markdown(f"**Cellule:** `{mapping.get('cellule', 'Non défini')}`")
-                        st.markdown(f"**Feuille:** {mapping.get('sheet_name', 'N/A')}")
-                        
-                        # Barre de confiance visuelle
-                        st.markdown(f"""
-                        <div style="margin: 1rem 0;">
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 0.25rem;">
-                                <span>Confiance</span>
-                                <span style="color: {conf_color}; font-weight: bold;">{confidence:.0%}</span>
-                            </div>
-                            <div style="background: #e0e0e0; height: 10px; border-radius: 5px;">
-                                <div style="width: {confidence*100}%; height: 100%; 
-                                            background: {conf_color}; border-radius: 5px;"></div>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Labels du tag
-                        if mapping.get('labels'):
-                            st.markdown("**🏷️ Labels du tag:**")
-                            for label in mapping.get('labels', [])[:3]:
-                                st.caption(f"• {label}")
-                        
-                        # Méthode de matching
-                        if mapping.get('matches'):
-                            st.markdown("**🔍 Méthode:**")
-                            st.caption(", ".join(mapping.get('matches', [])))
-                    
-                    # Actions
-                    st.markdown("---")
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        if st.button("✅ Valider", key=f"validate_{idx}", use_container_width=True):
-                            st.success("Validé!")
-                    with col2:
-                        if st.button("✏️ Modifier", key=f"edit_{idx}", use_container_width=True):
-                            st.session_state[f'editing_quick_{idx}'] = True
-                    with col3:
-                        if st.button("❌ Rejeter", key=f"reject_{idx}", use_container_width=True):
-                            st.warning("Rejeté - À mapper manuellement")
+        # Un tableau résumé : le détail n'est construit que pour l'association sélectionnée
+        shown_mappings = filtered_mappings[:20]  # Limiter à 20 pour la performance
+        st.dataframe(
+            pd.DataFrame({
+                'Description': [m.get('Description', '') for m in shown_mappings],
+                'cellule': [m.get('cellule', 'Non défini') for m in shown_mappings],
+                'sheet_name': [m.get('sheet_name', 'N/A') for m in shown_mappings],
+                # En pourcentage : le format printf de ProgressColumn n'applique pas d'échelle
+                'confidence_score': [m.get('confidence_score', 0) * 100 for m in shown_mappings],
+            }),
+            column_config={
+                "Description": st.column_config.TextColumn("📄 Description", width="large"),
+                "cellule": st.column_config.TextColumn("📊 Cellule"),
+                "sheet_name": st.column_config.TextColumn("Feuille"),
+                "confidence_score": st.column_config.ProgressColumn(
+                    "Confiance", format="%.0f%%", min_value=0, max_value=100
+                ),
+            },
+            hide_index=True,
+            use_container_width=True,
+            on_select=self._on_quick_mapping_selected,
+            selection_mode="single-row",
+            key="quick_mapping_table"
+        )
+        st.caption("Sélectionnez une ligne pour voir le détail de l'association")
+        
+        # Ouvert une fois par sélection (positionnée par le callback)
+        selected = st.session_state.pop('quick_mapping_open', None)
+        if selected is not None and selected < len(shown_mappings):
+            self._render_mapping_dialog(shown_mappings[selected], selected)
+        
+        if len(filtered_mappings) > 20:
+            st.info(f"Affichage limité aux 20 premiers résultats sur {len(filtered_mappings)}")
+    
+    @staticmethod
+    def _on_quick_mapping_selected():
+        """Selection callback: remembers which row's detail dialog to open on this run"""
+        rows = st.session_state.quick_mapping_table.selection.rows
+        if rows:
+            st.session_state.quick_mapping_open = rows[0]
+    
+    @st.dialog("Détail du mapping", width="large")
+    def _render_mapping_dialog(self, mapping: Dict[str, Any], idx: int):
+        """Détail et actions d'une association, rendus seulement pour la ligne sélectionnée"""
+        confidence = mapping.get('confidence_score', 0)
+        conf_color = "#28a745" if confidence > 0.7 else "#ffc107" if confidence > 0.5 else "#dc3545"
+        
+        # Layout en colonnes
+        col1, col2 = st.columns([3, 2])
+        
+        with col1:
+            # Informations source
+            st.markdown("**📥 Entrée Budgétaire**")
+            st.markdown(f"**Description:** {mapping.get('Description', 'N/A')}")
+            st.markdown(f"**Montant:** {mapping.get('Montant', 0):,.2f} €")
+            if mapping.get('Axe'):
+                st.markdown(f"**Axe:** {mapping.get('Axe')}")
+            if mapping.get('Nature'):
+                st.markdown(f"**Nature:** {mapping.get('Nature')}")
+            if mapping.get('Date'):
+                st.markdown(f"**📅 Date/Année:** {mapping.get('Date')}")
+            if mapping.get('SourcePhrase'):
+                with st.expander("📝 Phrase source"):
+                    st.text(mapping.get('SourcePhrase'))
+        
+        with col2:
+            # Informations cible
+            st.markdown("**📊 Cellule Excel Cible**")
+            st.markdown(f"**Cellule:** `{mapping.get('cellule', 'Non défini')}`")
+            st.markdown(f"**Feuille:** {mapping.get('sheet_name', 'N/A')}")
             
-            if len(filtered_mappings) > 20:
-                st.info(f"Affichage limité aux 20 premiers résultats sur {len(filtered_mappings)}")
+            # Barre de confiance visuelle
+            st.markdown(f"""
+            <div style="margin: 1rem 0;">
+                <div style="display: flex; justify-content: space-between; margin-bottom: 0.25rem;">
+                    <span>Confiance</span>
+                    <span style="color: {conf_color}; font-weight: bold;">{confidence:.0%}</span>
+                </div>
+                <div style="background: #e0e0e0; height: 10px; border-radius: 5px;">
+                    <div style="width: {confidence*100}%; height: 100%; 
+                                background: {conf_color}; border-radius: 5px;"></div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Labels du tag
+            if mapping.get('labels'):
+                st.markdown("**🏷️ Labels du tag:**")
+                for label in mapping.get('labels', [])[:3]:
+                    st.caption(f"• {label}")
+            
+            # Méthode de matching
+            if mapping.get('matches'):
+                st.markdown("**🔍 Méthode:**")
+                st.caption(", ".join(mapping.get('matches', [])))
+        
+        # Actions
+        st.markdown("---")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("✅ Valider", key=f"validate_{idx}", use_container_width=True):
+                st.success("Validé!")
+        with col2:
+            if st.button("✏️ Modifier", key=f"edit_{idx}", use_container_width=True):
+                st.session_state[f'editing_quick_{idx}'] = True
+        with col3:
+            if st.button("❌ Rejeter", key=f"reject_{idx}", use_container_width=True):
+                st.warning("Rejeté - À mapper manuellement")
 
     def _render_review_tab(self, report, debug_mode=False):
         """Onglet de révision détaillée avec tableaux interactifs"""
@@ -1123,14 +1477,8 @@ class MainLayout:
         
         # Préparer les données
         if st.session_state.get('pending_mapping'):
-            df = pd.DataFrame(st.session_state.pending_mapping)
-            
-            # Ajouter des colonnes calculées
-            df['Confiance_Level'] = pd.cut(
-                df['confidence_score'], 
-                bins=[0, 0.5, 0.7, 0.9, 1.0],
-                labels=['Faible', 'Moyen', 'Élevé', 'Très élevé']
-            )
+            # Colonnes calculées et colonnes manquantes ajoutées une fois par mapping
+            df = _review_dataframe()
             
             # Configuration des colonnes pour l'affichage
             column_config = {
@@ -1208,18 +1556,11 @@ class MainLayout:
                     format="%.0f%%"  # CORRECTION : Format correct pour le slider aussi
                 )
             
-            # Filtrer les données
-            filtered_df = df[df['confidence_score'] >= min_conf]
-            
-            # S'assurer que toutes les colonnes existent
-            for col in display_columns:
-                if col not in filtered_df.columns:
-                    if col == 'labels':
-                        filtered_df[col] = [[] for _ in range(len(filtered_df))]
-                    elif col == 'matches':
-                        filtered_df[col] = [[] for _ in range(len(filtered_df))]
-                    else:
-                        filtered_df[col] = ''
+            # Filtrer les données (masque NumPy, réutilisé pour les statistiques)
+            confidences = df['confidence_score'].to_numpy(dtype=float)
+            keep = confidences >= min_conf
+            filtered_df = df[keep]
+            shown_confidences = confidences[keep]
             
             # Afficher le tableau interactif
             try:
@@ -1241,17 +1582,13 @@ class MainLayout:
             with col1:
                 st.metric("Entrées affichées", len(filtered_df))
             with col2:
-                if len(filtered_df) > 0:
-                    avg_conf = filtered_df['confidence_score'].mean()
+                if shown_confidences.size > 0:
+                    avg_conf = np.nanmean(shown_confidences)
                     st.metric("Confiance moyenne", f"{avg_conf:.1%}")
                 else:
                     st.metric("Confiance moyenne", "N/A")
             with col3:
-                if len(filtered_df) > 0:
-                    low_conf_count = len(filtered_df[filtered_df['confidence_score'] < 0.7])
-                    st.metric("À vérifier", low_conf_count)
-                else:
-                    st.metric("À vérifier", 0)
+                st.metric("À vérifier", int(np.count_nonzero(shown_confidences < 0.7)))
         else:
             st.info("Aucun mapping en attente de révision")
 
@@ -1279,7 +1616,8 @@ class MainLayout:
             if col not in mapping_df.columns:
                 mapping_df[col] = ''
         
-        edit_df = mapping_df[display_cols].copy()
+        # La sélection par liste de colonnes renvoie déjà un nouveau DataFrame : pas de .copy()
+        edit_df = mapping_df[display_cols]
         
         # Editeur de données
         edited_df = st.data_editor(
@@ -1297,7 +1635,7 @@ class MainLayout:
                 ),
                 "sheet_name": st.column_config.SelectboxColumn(
                     "Feuille",
-                    options=st.session_state.excel_workbook.sheetnames if st.session_state.get('excel_workbook') else [],
+                    options=_workbook_sheetnames(),
                     required=True,
                     help="Feuille Excel cible"
                 ),
@@ -1317,11 +1655,11 @@ class MainLayout:
             },
             use_container_width=True,
             num_rows="fixed",
-            key="mapping_editor"
+            key=_editor_key("mapping_editor")
         )
         
         # Détecter les modifications
-        has_changes = not edit_df.equals(edited_df)
+        has_changes = _editor_has_changes(_editor_key("mapping_editor"))
         
         if has_changes:
             col1, col2 = st.columns(2)
@@ -1338,14 +1676,20 @@ class MainLayout:
                             # Marquer comme modifié manuellement
                             st.session_state.pending_mapping[idx]['manually_edited'] = True
                     
-                    st.success("✅ Modifications sauvegardées!")
+                    # Mapping modifié en place : la révision détaillée doit reconstruire son DataFrame
+                    st.session_state.pop('review_df_cache', None)
+                    
+                    # Diff consommé : l'éditeur repart des valeurs sauvegardées
+                    _reset_editor("mapping_editor")
+                    st.toast("✅ Modifications sauvegardées!")
                     st.rerun()
             
             with col2:
-                if st.button("❌ Annuler les modifications", 
-                            use_container_width=True,
-                            type="secondary"):
-                    st.rerun()
+                # Annuler = abandonner le diff de l'éditeur (un simple rerun le conserverait)
+                st.button("❌ Annuler les modifications", 
+                          use_container_width=True,
+                          type="secondary",
+                          on_click=_reset_editor, args=("mapping_editor",))
         
         # Instructions d'aide
         st.markdown("---")
@@ -1469,7 +1813,7 @@ class MainLayout:
                     # Formulaire de mapping sans colonnes imbriquées
                     target_sheet = st.selectbox(
                         "Feuille cible",
-                        st.session_state.excel_workbook.sheetnames if st.session_state.get('excel_workbook') else [],
+                        _workbook_sheetnames(),
                         key="target_sheet_unmapped"
                     )
                     target_cell = st.text_input(
@@ -1497,10 +1841,17 @@ class MainLayout:
                 )
                 
                 if pattern:
+                    # Descriptions normalisées (casefold) une fois par rapport, pas à chaque frappe
+                    cached = st.session_state.get('unmapped_descriptions')
+                    if not cached or cached[0] is not unmapped_items:
+                        cached = (unmapped_items, [item['description'].casefold() for item in unmapped_items])
+                        st.session_state.unmapped_descriptions = cached
+                    
                     # Filtrer les entrées correspondantes
+                    needle = pattern.casefold()
                     matching = [
-                        item for item in unmapped_items
-                        if pattern.lower() in item['description'].lower()
+                        unmapped_items[k] for k, description in enumerate(cached[1])
+                        if needle in description
                     ]
                     
                     if matching:
@@ -1516,7 +1867,7 @@ class MainLayout:
                         # Mapping groupé
                         batch_sheet = st.selectbox(
                             "Feuille pour toutes",
-                            st.session_state.excel_workbook.sheetnames if st.session_state.get('excel_workbook') else [],
+                            _workbook_sheetnames(),
                             key="batch_sheet"
                         )
                         batch_pattern = st.text_input(
@@ -1536,7 +1887,7 @@ class MainLayout:
     def _render_overview_tab(self, report):
         """Tab pour vue d'ensemble"""
         if st.session_state.get('extracted_data'):
-            df_all = pd.DataFrame(st.session_state.extracted_data)
+            df_all = _extracted_dataframe()
             
             # Afficher uniquement les colonnes disponibles
             display_cols = ['Description', 'Montant']
@@ -1549,14 +1900,4 @@ class MainLayout:
     
     def _render_drag_drop_overlay(self):
         """Renders drag and drop overlay"""
-        st.markdown("""
-        <div id="drop-overlay" class="drop-overlay">
-            <div class="drop-content">
-                <div class="drop-icon">
-                    <span style="font-size: 100px;">📥</span>
-                </div>
-                <h2>Déposez votre fichier ici</h2>
-                <p>PDF, DOCX, XLSX, JSON, TXT, MSG</p>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        st.markdown(_DROP_OVERLAY_HTML, unsafe_allow_html=True)
\ No newline at end of file
@@ -60,6 +60,11 @@ def get_main_styles() -> str:
             overflow: hidden;
         }
         
+        /* Chat input row (file uploader + chat_input) */
+        div[data-testid="stHorizontalBlock"]:has(div[data-testid="stChatInput"]) {
+            margin-top: 1rem;
+        }
+        
         /* Excel Panel Styles */
         .excel-panel, .excel-panel_full {
             background: #f5f7fa;
@@ -378,8 +383,13 @@ def get_javascript() -> str:
     <script>
         // Drag and drop functionality
         (function() {
+            // Réinjecté à chaque rerun : n'installer les écouteurs qu'une fois
+            if (window.__budgibot_js_installed) return;
+            window.__budgibot_js_installed = true;
+            
             let dragCounter = 0;
-            const dropOverlay = document.getElementById('drop-overlay');
+            // L'overlay est re-rendu par Streamlit : le chercher à chaque événement
+            const getOverlay = () => document.getElementById('drop-overlay');
             
             ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
                 document.addEventListener(eventName, e => {
@@ -390,6 +400,7 @@ def get_javascript() -> str:
             
             document.addEventListener('dragenter', () => {
                 dragCounter++;
+                const dropOverlay = getOverlay();
                 if (dragCounter === 1 && dropOverlay) {
                     dropOverlay.style.display = 'flex';
                 }
@@ -397,6 +408,7 @@ def get_javascript() -> str:
             
             document.addEventListener('dragleave', () => {
                 dragCounter--;
+                const dropOverlay = getOverlay();
                 if (dragCounter === 0 && dropOverlay) {
                     setTimeout(() => dropOverlay.style.display = 'none', 100);
                 }
@@ -404,6 +416,7 @@ def get_javascript() -> str:
             
             document.addEventListener('drop', e => {
                 dragCounter = 0;
+                const dropOverlay = getOverlay();
                 if (dropOverlay) dropOverlay.style.display = 'none';
                 
                 const files = e.dataTransfer.files;